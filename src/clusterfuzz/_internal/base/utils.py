@@ -907,11 +907,13 @@ def parse_delimited(value_or_handle, delimiter, strip=False,
   return processed_results
 
 
+@memoize.wrap(memoize.FifoInMemory(1))
 def is_oss_fuzz():
   """If this is an instance of OSS-Fuzz."""
   return default_project_name() == 'oss-fuzz'
 
 
+@memoize.wrap(memoize.FifoInMemory(1))
 def is_chromium():
   """If this is an instance of chromium fuzzing."""
   return default_project_name() in ('chromium', 'chromium-testing')
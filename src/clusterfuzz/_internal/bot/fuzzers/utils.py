@@ -94,18 +94,25 @@ def is_fuzz_target_local(file_path, file_handle=None):
 
 
 def get_fuzz_targets_local(path):
-  """Get list of fuzz targets paths (local)."""
+  """Get list of fuzz targets paths (local). Uses os.scandir so that the file
+  type comes from the cached DirEntry instead of an extra stat per entry."""
   fuzz_target_paths = []
+  subdirectories = []
 
-  for root, _, files in shell.walk(path):
-    for filename in files:
-      if os.path.basename(root) == EXTRA_BUILD_DIR:
-        # Ignore extra binaries.
-        continue
-
-      file_path = os.path.join(root, filename)
-      if is_fuzz_target_local(file_path):
-        fuzz_target_paths.append(file_path)
+  try:
+    with os.scandir(path) as entries:
+      for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+          # Ignore extra binaries.
+          if entry.name != EXTRA_BUILD_DIR:
+            subdirectories.append(entry.path)
+        elif entry.is_file() and is_fuzz_target_local(entry.path):
+          fuzz_target_paths.append(entry.path)
+  except OSError:
+    return fuzz_target_paths
+
+  for subdirectory in subdirectories:
+    fuzz_target_paths.extend(get_fuzz_targets_local(subdirectory))
 
   return fuzz_target_paths
 
@@ -300,13 +300,17 @@ class ChromeBuildArchive(DefaultBuildArchive):
 
 
 # pylint: disable=redefined-builtin
-def open(archive_path: str) -> BuildArchive:
+def open(archive_path: str,
+         file_obj: Optional[BinaryIO] = None) -> BuildArchive:
   """Opens the archive and gets the appropriate build archive based on the
   `archive_path`. The resulting object is usable as a normal archive reader,
-  but provides additional feature related to build handling.
+  but provides additional feature related to build handling. If `file_obj` is
+  not none, the binary file-like object will be used to read the archive
+  instead of opening `archive_path`.
 
   Args:
       archive_path: the path to the archive.
+      file_obj: a file-like object containing the archive.
 
   Raises:
       If the file could not be opened or if the archive type cannot be handled.
@@ -314,7 +318,7 @@ def open(archive_path: str) -> BuildArchive:
   Returns:
       the build archive.
   """
-  reader = archive.open(archive_path)
+  reader = archive.open(archive_path, file_obj=file_obj)
 
   # Unfortunately, there is no good heuristic for determining which build
   # archive implementation to use.
@@ -14,13 +14,16 @@
 """Build manager."""
 
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import os
 import re
 import shutil
 import subprocess
+import threading
 import time
 
 from clusterfuzz._internal.base import errors
+from clusterfuzz._internal.base import memoize
 from clusterfuzz._internal.base import utils
 from clusterfuzz._internal.build_management import build_archive
 from clusterfuzz._internal.build_management import overrides
@@ -52,8 +55,15 @@ BUILD_TYPE_SUBSTRINGS = [
     '-beta', '-stable', '-debug', '-release', '-symbolized', '-extended_stable'
 ]
 
+# Precompiled pattern to strip all build type substrings in a single pass.
+_BUILD_TYPE_RE = re.compile('|'.join(
+    re.escape(substring) for substring in BUILD_TYPE_SUBSTRINGS))
+
 # Build eviction constants.
 MAX_EVICTED_BUILDS = 100
+# Number of evictions after which free disk space is re-probed, instead of
+# being tracked via the sizes of the deleted builds.
+DISK_SPACE_REPROBE_INTERVAL = 10
 MIN_FREE_DISK_SPACE_CHROMIUM = 10 * 1024 * 1024 * 1024  # 10 GB
 MIN_FREE_DISK_SPACE_DEFAULT = 5 * 1024 * 1024 * 1024  # 5 GB
 TIMESTAMP_FILE = '.timestamp'
@@ -68,8 +78,20 @@ ICU_DATA_FILENAME = 'icudtl.dat'
 # Time for unpacking a build beyond which an error should be logged.
 UNPACK_TIME_LIMIT = 60 * 20
 
+# Minimum archive size for which a full garbage collection is worth running
+# before unpacking.
+_UNPACK_GC_THRESHOLD = 1024 * 1024 * 1024  # 1 GiB
+
+# Ranged read size when unpacking a build archive directly from storage.
+# Multi-gigabyte builds read with small ranges waste most of the time on
+# per-request overhead. Can be overridden with BUILD_REMOTE_UNZIP_CHUNK_SIZE.
+_REMOTE_UNZIP_CHUNK_SIZE = 16 * 1024 * 1024  # 16 MiB
+
 PATCHELF_SIZE_LIMIT = 1.5 * 1024 * 1024 * 1024  # 1.5 GiB
 
+# Minimum number of fuzz targets for which rpath patching is parallelized.
+_PATCH_RPATHS_PARALLEL_THRESHOLD = 4
+
 TARGETS_LIST_FILENAME = 'targets.list'
 
 BuildUrls = namedtuple('BuildUrls', ['bucket_path', 'urls_list'])
@@ -85,8 +107,20 @@ def _base_build_dir(bucket_path):
   return _get_build_directory(bucket_path, job_name)
 
 
+# Serializes free-space probing and build eviction. Concurrent unpacks (e.g.
+# symbolized release and debug builds) could otherwise pick the same build to
+# evict, racing its deletion, and double-count the freed bytes.
+_make_space_lock = threading.Lock()
+
+
 def _make_space(requested_size, current_build_dir=None):
   """Try to make the requested number of bytes available by deleting builds."""
+  with _make_space_lock:
+    return _make_space_locked(requested_size, current_build_dir)
+
+
+def _make_space_locked(requested_size, current_build_dir):
+  """Implementation of _make_space, with the eviction lock held."""
   if utils.is_chromium():
     min_free_disk_space = MIN_FREE_DISK_SPACE_CHROMIUM
   else:
@@ -96,19 +130,30 @@ def _make_space(requested_size, current_build_dir=None):
 
   error_message = 'Need at least %d GB of free disk space.' % (
       (min_free_disk_space + requested_size) // 1024**3)
-  for _ in range(MAX_EVICTED_BUILDS):
-    free_disk_space = shell.get_free_disk_space(builds_directory)
-    if free_disk_space is None:
-      # Can't determine free disk space, bail out.
-      return False
 
+  free_disk_space = shell.get_free_disk_space(builds_directory)
+  if free_disk_space is None:
+    # Can't determine free disk space, bail out.
+    return False
+
+  for eviction_count in range(1, MAX_EVICTED_BUILDS + 1):
     if requested_size + min_free_disk_space < free_disk_space:
       return True
 
-    if not _evict_build(current_build_dir):
+    evicted_size = _evict_build(current_build_dir, builds_directory)
+    if evicted_size is None:
       logs.log_error(error_message)
       return False
 
+    # Between two evictions, free disk space changes only by the size of the
+    # deleted build, so track the delta instead of doing a syscall on every
+    # iteration. Re-probe occasionally as a safety check.
+    free_disk_space += evicted_size
+    if eviction_count % DISK_SPACE_REPROBE_INTERVAL == 0:
+      free_disk_space = shell.get_free_disk_space(builds_directory)
+      if free_disk_space is None:
+        return False
+
   free_disk_space = shell.get_free_disk_space(builds_directory)
   result = requested_size + min_free_disk_space < free_disk_space
   if not result:
@@ -116,41 +161,66 @@ def _make_space(requested_size, current_build_dir=None):
   return result
 
 
-def _evict_build(current_build_dir):
-  """Remove the least recently used build to make room."""
-  builds_directory = environment.get_value('BUILDS_DIR')
+def _evict_build(current_build_dir, builds_directory=None):
+  """Remove the least recently used build to make room. Returns the size in
+  bytes of the deleted build, or None if there was nothing to evict."""
+  if builds_directory is None:
+    builds_directory = environment.get_value('BUILDS_DIR')
+
   least_recently_used = None
   least_recently_used_timestamp = None
 
-  for build_directory in os.listdir(builds_directory):
-    absolute_build_directory = os.path.abspath(
-        os.path.join(builds_directory, build_directory))
-    if not os.path.isdir(absolute_build_directory):
-      continue
+  absolute_builds_directory = os.path.abspath(builds_directory)
+  absolute_current_build_dir = (
+      os.path.abspath(current_build_dir) if current_build_dir else None)
+
+  # Since entries are direct children of the builds directory, the build being
+  # extracted can be excluded with a single name comparison instead of a path
+  # computation per entry.
+  excluded_entry_name = None
+  if absolute_current_build_dir:
+    relative_build_path = os.path.relpath(absolute_current_build_dir,
+                                          absolute_builds_directory)
+    if os.pardir not in relative_build_path.split(os.sep):
+      excluded_entry_name = relative_build_path.split(os.sep)[0]
+
+  with os.scandir(absolute_builds_directory) as build_dir_entries:
+    for entry in build_dir_entries:
+      # DirEntry caches the stat from the directory listing, avoiding an extra
+      # stat call per entry.
+      if not entry.is_dir(follow_symlinks=False):
+        continue
 
-    if os.path.commonpath(
-        [absolute_build_directory,
-         os.path.abspath(current_build_dir)]) == absolute_build_directory:
-      # Don't evict the build we're trying to extract. This could be a parent
-      # directory of where we're currently extracting to.
-      continue
+      if entry.name == excluded_entry_name:
+        # Don't evict the build we're trying to extract. This could be a parent
+        # directory of where we're currently extracting to.
+        continue
 
-    build = BaseBuild(absolute_build_directory)
-    timestamp = build.last_used_time()
+      build = BaseBuild(entry.path)
+      timestamp = build.last_used_time()
 
-    if (least_recently_used_timestamp is None or
-        timestamp < least_recently_used_timestamp):
-      least_recently_used_timestamp = timestamp
-      least_recently_used = build
+      if (least_recently_used_timestamp is None or
+          timestamp < least_recently_used_timestamp):
+        least_recently_used_timestamp = timestamp
+        least_recently_used = build
 
   if not least_recently_used:
-    return False
+    return None
 
   logs.log(
       'Deleting build %s to save space.' % least_recently_used.base_build_dir)
+  evicted_size = shell.get_directory_size(least_recently_used.base_build_dir)
   least_recently_used.delete()
 
-  return True
+  return evicted_size
+
+
+def _maybe_gc(archive_size):
+  """Run a full garbage collection before unpacking a build, but only when the
+  build is large (or of unknown size) so that the freed memory is worth the
+  full-heap traversal."""
+  if archive_size is None or archive_size > _UNPACK_GC_THRESHOLD:
+    utils.python_gc()
 
 
 def _handle_unrecoverable_error_on_windows():
@@ -165,6 +235,7 @@ def _handle_unrecoverable_error_on_windows():
   utils.restart_machine()
 
 
+@memoize.wrap(memoize.FifoInMemory(64))
 def _remove_scheme(bucket_path):
   """Remove scheme from the bucket path."""
   if '://' not in bucket_path:
@@ -176,7 +247,14 @@ def _remove_scheme(bucket_path):
 def _get_build_directory(bucket_path, job_name):
   """Return the build directory based on bucket path and job name."""
   builds_directory = environment.get_value('BUILDS_DIR')
+  return _get_build_directory_cached(builds_directory, bucket_path, job_name)
+
 
+@memoize.wrap(memoize.FifoInMemory(64))
+def _get_build_directory_cached(builds_directory, bucket_path, job_name):
+  """Compute the build directory. This is a pure function of its arguments, so
+  the result is memoized to avoid repeated parsing and hashing on the hot
+  setup and eviction paths."""
   # In case we have a bucket path, we want those to share the same build
   # directory.
   if bucket_path:
@@ -185,7 +263,7 @@ def _get_build_directory(bucket_path, job_name):
     bucket_path = bucket_path.replace('/', '_')
 
     # Remove similar build types to force them in same directory.
-    file_pattern = utils.remove_sub_strings(file_pattern, BUILD_TYPE_SUBSTRINGS)
+    file_pattern = _BUILD_TYPE_RE.sub('', file_pattern)
 
     file_pattern_hash = utils.string_hash(file_pattern)
     job_directory = f'{bucket_path}_{file_pattern_hash}'
@@ -251,9 +329,7 @@ def set_environment_vars(search_directories, app_path='APP_PATH',
   app_directory = None
   use_default_llvm_symbolizer = environment.get_value(
       'USE_DEFAULT_LLVM_SYMBOLIZER')
-
-  # Chromium specific folder to ignore.
-  initialexe_folder_path = f'{os.path.sep}initialexe'
+  system_binary_dir = environment.get_value('SYSTEM_BINARY_DIR')
 
   logs.log('\n'.join([
       'Walking build directory to find files and set environment variables.',
@@ -269,39 +345,77 @@ def set_environment_vars(search_directories, app_path='APP_PATH',
     logs.log(f'Setting environment variable: {full_name} = {value}')
     environment.set_value(full_name, value)
 
-  for search_directory in search_directories:
-    logs.log(f'Searching in directory: {search_directory}')
-    for root, _, files in shell.walk(search_directory):
-      # .dSYM folder contain symbol files on Mac and should
-      # not be searched for application binary.
-      if platform == 'MAC' and '.dSYM' in root:
-        continue
-
-      # Ignore some folders on Windows.
-      if (platform == 'WINDOWS' and (initialexe_folder_path in root)):
-        continue
+  def scan_for_targets(directory, wanted):
+    """Recursively yield (file name, full path) pairs for files in |directory|
+    whose names are keys of |wanted|, using os.scandir to avoid extra stat
+    calls. Ignored folders are pruned before recursing into them, and the scan
+    stops once the caller has emptied |wanted|."""
+    subdirectories = []
+    try:
+      with os.scandir(directory) as entries:
+        for entry in entries:
+          if not wanted:
+            return
+
+          if entry.name in wanted and entry.is_file():
+            yield entry.name, entry.path
+          elif entry.is_dir(follow_symlinks=False):
+            # .dSYM folders contain symbol files on Mac and should
+            # not be searched for application binary.
+            if platform == 'MAC' and '.dSYM' in entry.name:
+              continue
+
+            # Ignore some folders on Windows.
+            if platform == 'WINDOWS' and entry.name == 'initialexe':
+              continue
+
+            subdirectories.append(entry.path)
+    except OSError:
+      return
 
-      for filename in files:
-        if not absolute_file_path and filename == app_name:
-          absolute_file_path = os.path.join(root, filename)
-          app_directory = os.path.dirname(absolute_file_path)
+    for subdirectory in subdirectories:
+      if not wanted:
+        return
 
-          # We don't want to change the state of system binaries.
-          if not environment.get_value('SYSTEM_BINARY_DIR'):
-            os.chmod(absolute_file_path, 0o750)
+      yield from scan_for_targets(subdirectory, wanted)
 
-          set_env_var(app_path, absolute_file_path)
-          set_env_var('APP_DIR', app_directory)
+  # Dispatch table keyed by file name, so each scanned file costs a single
+  # dict lookup rather than a chain of comparisons.
+  APP, GN_ARGS, LLVM_SYMBOLIZER = range(3)
+  wanted = {gn_args_filename: GN_ARGS}
+  if app_name:
+    wanted[app_name] = APP
+  if not use_default_llvm_symbolizer:
+    wanted[llvm_symbolizer_filename] = LLVM_SYMBOLIZER
 
-        if not gn_args_path and filename == gn_args_filename:
-          gn_args_path = os.path.join(root, gn_args_filename)
-          set_env_var('GN_ARGS_PATH', gn_args_path)
+  for search_directory in search_directories:
+    if not wanted:
+      break
 
-        if (not llvm_symbolizer_path and
-            filename == llvm_symbolizer_filename and
-            not use_default_llvm_symbolizer):
-          llvm_symbolizer_path = os.path.join(root, llvm_symbolizer_filename)
-          set_env_var('LLVM_SYMBOLIZER_PATH', llvm_symbolizer_path)
+    logs.log(f'Searching in directory: {search_directory}')
+    for filename, file_path in scan_for_targets(search_directory, wanted):
+      target = wanted.pop(filename, None)
+
+      if target == APP:
+        absolute_file_path = file_path
+        app_directory = os.path.dirname(absolute_file_path)
+
+        # We don't want to change the state of system binaries.
+        if not system_binary_dir:
+          os.chmod(absolute_file_path, 0o750)
+
+        set_env_var(app_path, absolute_file_path)
+        set_env_var('APP_DIR', app_directory)
+      elif target == GN_ARGS:
+        gn_args_path = file_path
+        set_env_var('GN_ARGS_PATH', gn_args_path)
+      elif target == LLVM_SYMBOLIZER:
+        llvm_symbolizer_path = file_path
+        set_env_var('LLVM_SYMBOLIZER_PATH', llvm_symbolizer_path)
+
+      if not wanted:
+        # Everything has been found; don't resume the scan.
+        break
 
   if app_name and not absolute_file_path:
     logs.log_error(f'Could not find app {app_name!r} in search directories.')
@@ -316,9 +430,12 @@ class BaseBuild:
   def last_used_time(self):
     """Return the last used time for the build."""
     timestamp_file_path = os.path.join(self.base_build_dir, TIMESTAMP_FILE)
-    timestamp = utils.read_data_from_file(timestamp_file_path, eval_data=True)
-
-    return timestamp or 0
+    try:
+      # The timestamp file's mtime tracks last use, so a single stat suffices
+      # instead of reading and parsing the file contents.
+      return os.stat(timestamp_file_path).st_mtime
+    except OSError:
+      return 0
 
   def delete(self):
     """Delete this build."""
@@ -349,8 +466,13 @@ class Build(BaseBuild):
     """Deletes partial build file (if present). This is needed to make sure we
     clean up build directory if the previous build was partial."""
     partial_build_file_path = os.path.join(self.build_dir, PARTIAL_BUILD_FILE)
-    if os.path.exists(partial_build_file_path):
-      self.delete()
+    try:
+      os.stat(partial_build_file_path)
+    except FileNotFoundError:
+      # Common case: the previous build was complete.
+      return
+
+    self.delete()
 
   def _pre_setup(self):
     """Common pre-setup."""
@@ -384,8 +506,18 @@ class Build(BaseBuild):
       # Import here as this path is not available in App Engine context.
       from clusterfuzz._internal.bot.fuzzers import utils as fuzzer_utils
 
-      for target_path in fuzzer_utils.get_fuzz_targets(self.build_dir):
-        self._patch_rpath(target_path, instrumented_library_paths)
+      target_paths = list(fuzzer_utils.get_fuzz_targets(self.build_dir))
+      if len(target_paths) > _PATCH_RPATHS_PARALLEL_THRESHOLD:
+        # Each patch spawns a subprocess, so this is I/O bound and threads are
+        # enough to overlap the fork/execs.
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+          list(
+              executor.map(
+                  lambda target_path: self._patch_rpath(
+                      target_path, instrumented_library_paths), target_paths))
+      else:
+        for target_path in target_paths:
+          self._patch_rpath(target_path, instrumented_library_paths)
     else:
       app_path = environment.get_value('APP_PATH')
       if app_path:
@@ -400,16 +532,56 @@ class Build(BaseBuild):
     if update_revision:
       self._write_revision()
 
-    # Update timestamp to indicate when this build was last used.
+    # Update timestamp to indicate when this build was last used. Last use is
+    # tracked via the file's mtime; the wall time is still written on creation
+    # for older readers of the file contents.
     if self.base_build_dir:
       timestamp_file_path = os.path.join(self.base_build_dir, TIMESTAMP_FILE)
-      utils.write_data_to_file(time.time(), timestamp_file_path)
+      now = time.time()
+      if not os.path.exists(timestamp_file_path):
+        utils.write_data_to_file(now, timestamp_file_path)
+      os.utime(timestamp_file_path, (now, now))
 
     # Update rpaths if necessary (for e.g. instrumented libraries).
     instrumented_library_paths = environment.get_instrumented_libraries_paths()
     if instrumented_library_paths:
       self._patch_rpaths(instrumented_library_paths)
 
+  def _open_build_archive(self, base_build_dir, build_dir, build_url,
+                          archive_size):
+    """Open the build archive, streaming it directly from storage when the
+    archive format supports random access reads. Returns a tuple of the build
+    archive and the local archive path; the latter is None when streaming,
+    since nothing was written to disk."""
+    # Zip archives support random access, so they can be read directly over
+    # ranged storage reads without writing and re-reading a local copy. Tar
+    # archives require contiguous reads and still go through a local download.
+    if archive.get_archive_type(build_url) == archive.ArchiveType.ZIP:
+      try:
+        chunk_size = environment.get_value('BUILD_REMOTE_UNZIP_CHUNK_SIZE',
+                                           _REMOTE_UNZIP_CHUNK_SIZE)
+        build_stream = storage.open_stream(build_url, chunk_size=chunk_size)
+        if build_stream:
+          logs.log(f'Streaming build archive from {build_url}.')
+          return build_archive.open(build_url, file_obj=build_stream), None
+      except Exception as e:
+        logs.log_warn(f'Unable to stream build from {build_url}: {e}. '
+                      'Falling back to local download.')
+
+    build_local_archive = os.path.join(build_dir, os.path.basename(build_url))
+
+    # Make the disk space necessary for the archive available.
+    if archive_size is not None and not _make_space(archive_size,
+                                                    base_build_dir):
+      shell.clear_data_directories()
+      logs.log_fatal_and_exit(
+          'Failed to make space for download. '
+          'Cleared all data directories to free up space, exiting.')
+
+    logs.log(f'Downloading build from {build_url}.')
+    storage.copy_file_from(build_url, build_local_archive)
+    return build_archive.open(build_local_archive), build_local_archive
+
   def _unpack_build(self,
                     base_build_dir,
                     build_dir,
@@ -421,8 +593,9 @@ class Build(BaseBuild):
 
     logs.log(f'Unpacking build from {build_url} into {build_dir}.')
 
-    # Free up memory.
-    utils.python_gc()
+    # Free up memory, if the build is large enough for it to matter.
+    archive_size = storage.get_object_size(build_url)
+    _maybe_gc(archive_size)
 
     # Remove the current build.
     logs.log(f'Removing build directory {build_dir}.')
@@ -431,27 +604,15 @@ class Build(BaseBuild):
       _handle_unrecoverable_error_on_windows()
       return False
 
-    # Download build archive locally.
-    build_local_archive = os.path.join(build_dir, os.path.basename(build_url))
-
-    # Make the disk space necessary for the archive available.
-    archive_size = storage.get_object_size(build_url)
-    if archive_size is not None and not _make_space(archive_size,
-                                                    base_build_dir):
-      shell.clear_data_directories()
-      logs.log_fatal_and_exit(
-          'Failed to make space for download. '
-          'Cleared all data directories to free up space, exiting.')
-
-    logs.log(f'Downloading build from {build_url}.')
     try:
-      storage.copy_file_from(build_url, build_local_archive)
+      opened_archive, build_local_archive = self._open_build_archive(
+          base_build_dir, build_dir, build_url, archive_size)
     except Exception as e:
       logs.log_error(f'Unable to download build from {build_url}: {e}')
       return False
 
     try:
-      with build_archive.open(build_local_archive) as build:
+      with opened_archive as build:
         unpack_everything = environment.get_value(
             'UNPACK_ALL_FUZZ_TARGETS_AND_FILES')
         if not unpack_everything:
@@ -481,29 +642,29 @@ class Build(BaseBuild):
               'Failed to make space for build. '
               'Cleared all data directories to free up space, exiting.')
 
-        # Unpack the local build archive.
-        logs.log(
-            f'Unpacking build archive {build_local_archive} to {build_dir}.')
+        # Unpack the build archive.
+        logs.log(f'Unpacking build archive {build_url} to {build_dir}.')
         trusted = not utils.is_oss_fuzz()
 
         build.unpack(
             build_dir=build_dir, fuzz_target=fuzz_target, trusted=trusted)
     except Exception as e:
-      logs.log_error(
-          f'Unable to unpack build archive {build_local_archive}: {e}')
+      logs.log_error(f'Unable to unpack build archive {build_url}: {e}')
       return False
 
     if unpack_everything:
       self._pick_fuzz_target(
           self._get_fuzz_targets_from_dir(build_dir), target_weights)
+      self._write_targets_list(build_dir)
     else:
       # If this is partial build due to selected build files, then mark it as
       # such so that it is not re-used.
       partial_build_file_path = os.path.join(build_dir, PARTIAL_BUILD_FILE)
       utils.write_data_to_file('', partial_build_file_path)
 
-    # No point in keeping the archive around.
-    shell.remove_file(build_local_archive)
+    # No point in keeping the archive around, if one was downloaded.
+    if build_local_archive:
+      shell.remove_file(build_local_archive)
 
     elapsed_time = time.time() - start_time
     elapsed_mins = elapsed_time / 60.
@@ -520,6 +681,22 @@ class Build(BaseBuild):
     for path in fuzzer_utils.get_fuzz_targets(build_dir):
       yield fuzzer_utils.normalize_target_name(path)
 
+  def _write_targets_list(self, build_dir):
+    """Persist the fuzz targets found during unpack, so that later setups of
+    the same build do not need to re-walk the build directory."""
+    targets_list_path = os.path.join(build_dir, TARGETS_LIST_FILENAME)
+    utils.write_data_to_file('\n'.join(self.fuzz_targets), targets_list_path)
+
+  def _read_targets_list(self, build_dir):
+    """Return the fuzz targets persisted during unpack, or None if the targets
+    list file is missing."""
+    targets_list_path = os.path.join(build_dir, TARGETS_LIST_FILENAME)
+    try:
+      with open(targets_list_path) as file_handle:
+        return file_handle.read().splitlines()
+    except OSError:
+      return None
+
   def _pick_fuzz_target(self, fuzz_targets, target_weights):
     """Selects a fuzz target for fuzzing."""
     self.fuzz_targets = list(fuzz_targets)
@@ -539,19 +716,17 @@ class Build(BaseBuild):
   def exists(self):
     """Check if build already exists."""
     revision_file = os.path.join(self.build_dir, REVISION_FILE_NAME)
-    if os.path.exists(revision_file):
-      with open(revision_file) as file_handle:
-        try:
-          current_revision = int(file_handle.read())
-        except ValueError:
-          current_revision = -1
-
-      # We have the revision required locally, no more work to do, other than
-      # setting application path environment variables.
-      if self.revision == current_revision:
-        return True
+    try:
+      # Open directly instead of checking for existence first, saving a stat.
+      # Binary mode avoids newline translation for this numeric field.
+      with open(revision_file, 'rb') as file_handle:
+        current_revision = int(file_handle.read())
+    except (OSError, ValueError):
+      return False
 
-    return False
+    # We have the revision required locally, no more work to do, other than
+    # setting application path environment variables.
+    return self.revision == current_revision
 
   def delete(self):
     """Delete this build."""
@@ -602,9 +777,12 @@ class Build(BaseBuild):
     symbolic_link_target = environment.get_value(self.env_prefix +
                                                  'SYMBOLIC_LINK')
     if symbolic_link_target:
-      os.system('mkdir --parents %s' % os.path.dirname(symbolic_link_target))
-      os.system('rm %s' % symbolic_link_target)
-      os.system('ln -s %s %s' % (app_directory, symbolic_link_target))
+      os.makedirs(os.path.dirname(symbolic_link_target), exist_ok=True)
+      try:
+        os.unlink(symbolic_link_target)
+      except FileNotFoundError:
+        pass
+      os.symlink(app_directory, symbolic_link_target)
 
     if utils.is_chromium():
       # Use deterministic fonts when available. See crbug.com/822737.
@@ -660,8 +838,12 @@ class RegularBuild(Build):
 
       logs.log('Retrieved build r%d.' % self.revision)
     else:
-      self._pick_fuzz_target(
-          self._get_fuzz_targets_from_dir(self.build_dir), self.target_weights)
+      fuzz_targets = self._read_targets_list(self.build_dir)
+      if fuzz_targets is None:
+        # The targets list may be missing for builds unpacked before it was
+        # introduced; fall back to walking the build directory.
+        fuzz_targets = self._get_fuzz_targets_from_dir(self.build_dir)
+      self._pick_fuzz_target(fuzz_targets, self.target_weights)
 
       # We have the revision required locally, no more work to do, other than
       # setting application path environment variables.
@@ -789,20 +971,22 @@ class SymbolizedBuild(Build):
       _handle_unrecoverable_error_on_windows()
       return False
 
-    if not self.release_build_url and not self.debug_build_url:
+    build_specs = [(build_dir, build_url)
+                   for build_dir, build_url in (
+                       (self.release_build_dir, self.release_build_url),
+                       (self.debug_build_dir, self.debug_build_url),
+                   ) if build_url]
+    if not build_specs:
       return False
 
-    if self.release_build_url:
-      if not self._unpack_build(self.base_build_dir, self.release_build_dir,
-                                self.release_build_url):
-        return False
-
-    if self.debug_build_url:
-      if not self._unpack_build(self.base_build_dir, self.debug_build_dir,
-                                self.debug_build_url):
-        return False
-
-    return True
+    # The release and debug builds unpack into disjoint directories and don't
+    # depend on each other, so download and unpack them in parallel.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+      futures = [
+          executor.submit(self._unpack_build, self.base_build_dir, build_dir,
+                          build_url) for build_dir, build_url in build_specs
+      ]
+      return all(future.result() for future in futures)
 
   def setup(self):
     self._pre_setup()
@@ -851,6 +1035,30 @@ class CustomBuild(Build):
   def build_dir(self):
     return self._build_dir
 
+  def _open_remote_custom_build(self, gcs_path):
+    """Try to open the custom build archive streamed directly from storage, so
+    that extraction overlaps the download instead of following it. Returns
+    None when the archive format doesn't support random access reads or when
+    streaming fails."""
+    if (archive.get_archive_type(self.custom_binary_filename) !=
+        archive.ArchiveType.ZIP):
+      return None
+
+    try:
+      chunk_size = environment.get_value('BUILD_REMOTE_UNZIP_CHUNK_SIZE',
+                                         _REMOTE_UNZIP_CHUNK_SIZE)
+      build_stream = storage.open_stream(gcs_path, chunk_size=chunk_size)
+      if not build_stream:
+        return None
+
+      logs.log(f'Streaming custom build from {gcs_path}.')
+      return build_archive.open(
+          self.custom_binary_filename, file_obj=build_stream)
+    except Exception as e:
+      logs.log_warn(f'Unable to stream custom build from {gcs_path}: {e}. '
+                    'Falling back to local download.')
+      return None
+
   def _unpack_custom_build(self):
     """Unpack the custom build."""
     if not shell.remove_directory(self.build_dir, recreate=True):
@@ -862,28 +1070,33 @@ class CustomBuild(Build):
                                        self.custom_binary_filename)
     custom_builds_bucket = local_config.ProjectConfig().get(
         'custom_builds.bucket')
+    build = None
     if custom_builds_bucket:
-      directory = os.path.dirname(build_local_archive)
-      if not os.path.exists(directory):
-        os.makedirs(directory)
+      os.makedirs(os.path.dirname(build_local_archive), exist_ok=True)
       gcs_path = f'/{custom_builds_bucket}/{self.custom_binary_key}'
-      storage.copy_file_from(gcs_path, build_local_archive)
+      build = self._open_remote_custom_build(gcs_path)
+      if build is None:
+        storage.copy_file_from(gcs_path, build_local_archive)
     elif not blobs.read_blob_to_disk(self.custom_binary_key,
                                      build_local_archive):
       return False
 
     # If custom binary is an archive, then unpack it.
     if archive.is_archive(self.custom_binary_filename):
-      try:
-        build = build_archive.open(build_local_archive)
-      except:
-        logs.log_error('Unable to open build archive %s.' % build_local_archive)
-        return False
+      streamed = build is not None
+      if not streamed:
+        try:
+          build = build_archive.open(build_local_archive)
+        except:
+          logs.log_error(
+              'Unable to open build archive %s.' % build_local_archive)
+          return False
       if not _make_space(build.unpacked_size(), self.base_build_dir):
         # Remove downloaded archive to free up space and otherwise, it won't get
         # deleted until next job run.
         build.close()
-        shell.remove_file(build_local_archive)
+        if not streamed:
+          shell.remove_file(build_local_archive)
 
         logs.log_fatal_and_exit('Could not make space for build.')
 
@@ -896,8 +1109,9 @@ class CustomBuild(Build):
         return False
 
       build.close()
-      # Remove the archive.
-      shell.remove_file(build_local_archive)
+      if not streamed:
+        # Remove the archive.
+        shell.remove_file(build_local_archive)
 
     self._pick_fuzz_target(
         self._get_fuzz_targets_from_dir(self.build_dir), self.target_weights)
@@ -962,9 +1176,10 @@ def _sort_build_urls_by_revision(build_urls, bucket_path, reverse):
   _, base_path = storage.get_bucket_name_and_path(base_url)
   base_path_with_seperator = base_path + '/' if base_path else ''
 
+  # Compile once, outside the loop; this runs over every url in the bucket.
+  match_pattern = re.compile(f'{base_path_with_seperator}({file_pattern})')
   for build_url in build_urls:
-    match_pattern = f'{base_path_with_seperator}({file_pattern})'
-    match = re.match(match_pattern, build_url)
+    match = match_pattern.match(build_url)
     if match:
       filename = match.group(1)
       revision = match.group(2)
@@ -983,18 +1198,29 @@ def _sort_build_urls_by_revision(build_urls, bucket_path, reverse):
     sorted_revisions = sorted(
         filename_by_revision_dict,
         reverse=reverse,
-        key=lambda x: list(map(int, x.split('.'))))
+        key=lambda x: tuple(int(part) for part in x.split('.')))
   except:
     logs.log_warn(
         'Revision pattern is not an integer, falling back to string sort.')
     sorted_revisions = sorted(filename_by_revision_dict, reverse=reverse)
 
-  sorted_build_urls = []
-  for revision in sorted_revisions:
-    filename = filename_by_revision_dict[revision]
-    sorted_build_urls.append('%s/%s' % (base_url, filename))
+  return [
+      '%s/%s' % (base_url, filename_by_revision_dict[revision])
+      for revision in sorted_revisions
+  ]
+
 
-  return sorted_build_urls
+@memoize.wrap(memoize.FifoInMemory(16))
+def _get_sorted_build_urls_from_keys_file(bucket_path, keys_file_path,
+                                          keys_file_mtime, reverse):
+  """Read, parse and sort the build urls from a local keys file. Keyed on the
+  keys file mtime, so a refreshed file invalidates the cached result."""
+  del keys_file_mtime  # Only part of the cache key.
+  # Stream lines straight from the file instead of materializing one big
+  # content string; the sort below consumes its input in a single pass.
+  with open(keys_file_path) as file_handle:
+    return _sort_build_urls_by_revision(
+        (line.rstrip('\n') for line in file_handle), bucket_path, reverse)
 
 
 def get_build_urls_list(bucket_path, reverse=True):
@@ -1004,29 +1230,33 @@ def get_build_urls_list(bucket_path, reverse=True):
 
   base_url = os.path.dirname(bucket_path)
   if environment.is_running_on_app_engine():
-    build_urls = list(storage.list_blobs(base_url))
-  else:
-    keys_directory = environment.get_value('BUILD_URLS_DIR')
-    keys_filename = '%s.list' % utils.string_hash(bucket_path)
-    keys_file_path = os.path.join(keys_directory, keys_filename)
-
-    # For one task, keys file that is cached locally should be re-used.
-    # Otherwise, we do waste lot of network bandwidth calling and getting the
-    # same set of urls (esp for regression and progression testing).
-    if not os.path.exists(keys_file_path):
-      # Get url list by reading the GCS bucket.
-      with open(keys_file_path, 'w') as f:
-        for path in storage.list_blobs(base_url):
-          f.write(path + '\n')
-
-    content = utils.read_data_from_file(
-        keys_file_path, eval_data=False).decode('utf-8')
-    if not content:
-      return []
-
-    build_urls = content.splitlines()
-
-  return _sort_build_urls_by_revision(build_urls, bucket_path, reverse)
+    # No need to materialize the blob listing; it is consumed in one pass.
+    return _sort_build_urls_by_revision(
+        storage.list_blobs(base_url), bucket_path, reverse)
+
+  keys_directory = environment.get_value('BUILD_URLS_DIR')
+  keys_filename = '%s.list' % utils.string_hash(bucket_path)
+  keys_file_path = os.path.join(keys_directory, keys_filename)
+
+  # For one task, keys file that is cached locally should be re-used.
+  # Otherwise, we do waste lot of network bandwidth calling and getting the
+  # same set of urls (esp for regression and progression testing).
+  if not os.path.exists(keys_file_path):
+    # Get url list by reading the GCS bucket. Write to a temporary file and
+    # rename it into place, so that a concurrent task never observes (and
+    # caches) a partially written keys file.
+    temp_keys_file_path = '%s.tmp.%d' % (keys_file_path, os.getpid())
+    with open(temp_keys_file_path, 'w') as f:
+      for path in storage.list_blobs(base_url):
+        f.write(path + '\n')
+
+    os.replace(temp_keys_file_path, keys_file_path)
+
+  # The same bucket is typically listed several times within one task, so the
+  # parsed and sorted result is cached in-process as well.
+  return _get_sorted_build_urls_from_keys_file(bucket_path, keys_file_path,
+                                               os.path.getmtime(keys_file_path),
+                                               reverse)
 
 
 def get_primary_bucket_path():
@@ -1061,35 +1291,39 @@ def get_revisions_list(bucket_path, bad_revisions, testcase=None):
   if not revision_urls:
     return None
 
-  # Parse the revisions out of the build urls.
+  # Parse the revisions out of the build urls, with the pattern compiled once
+  # up front rather than looked up per url.
+  compiled_revision_pattern = re.compile(revision_pattern)
   revision_list = []
   for url in revision_urls:
-    match = re.match(revision_pattern, url)
+    match = compiled_revision_pattern.match(url)
     if match:
       revision = revisions.convert_revision_to_integer(match.group(1))
       revision_list.append(revision)
 
-  for bad_revision in bad_revisions:
+  excluded_revisions = set(bad_revisions)
+  if testcase:
     # Don't remove testcase revision even if it is in bad build list. This
     # usually happens when a bad bot sometimes marks a particular revision as
     # bad due to flakiness.
-    if testcase and bad_revision == testcase.crash_revision:
-      continue
+    excluded_revisions.discard(testcase.crash_revision)
 
-    if bad_revision in revision_list:
-      revision_list.remove(bad_revision)
-
-  return revision_list
+  return [
+      revision for revision in revision_list
+      if revision not in excluded_revisions
+  ]
 
 
 def get_job_bad_revisions():
   job_type = environment.get_value('JOB_NAME')
 
-  bad_builds = list(
-      ndb_utils.get_all_from_query(
-          data_types.BuildMetadata.query(
-              ndb_utils.is_true(data_types.BuildMetadata.bad_build),
-              data_types.BuildMetadata.job_type == job_type)))
+  # Project just the revision so that full BuildMetadata entities aren't
+  # fetched and decoded only to read a single field.
+  bad_builds = ndb_utils.get_all_from_query(
+      data_types.BuildMetadata.query(
+          ndb_utils.is_true(data_types.BuildMetadata.bad_build),
+          data_types.BuildMetadata.job_type == job_type,
+          projection=[data_types.BuildMetadata.revision]))
   return [build.revision for build in bad_builds]
 
 
@@ -1104,16 +1338,26 @@ def _get_targets_list(bucket_path):
   fuzz targets."""
   bucket_dir_path = os.path.dirname(os.path.dirname(bucket_path))
   targets_list_path = os.path.join(bucket_dir_path, TARGETS_LIST_FILENAME)
-  data = storage.read_data(targets_list_path)
+
+  def _list_built_targets():
+    return {
+        os.path.basename(path.rstrip('/'))
+        for path in storage.list_blobs(bucket_dir_path, recursive=False)
+    }
+
+  # The targets.list read and the bucket listing are independent GCS
+  # round-trips, so issue them concurrently.
+  with ThreadPoolExecutor(max_workers=2) as executor:
+    data_future = executor.submit(storage.read_data, targets_list_path)
+    listed_targets_future = executor.submit(_list_built_targets)
+    data = data_future.result()
+    listed_targets = listed_targets_future.result()
+
   if not data:
     return None
 
   # Filter out targets which are not yet built.
   targets = data.decode('utf-8').splitlines()
-  listed_targets = {
-      os.path.basename(path.rstrip('/'))
-      for path in storage.list_blobs(bucket_dir_path, recursive=False)
-  }
   return [t for t in targets if _base_fuzz_target_name(t) in listed_targets]
 
 
@@ -1146,29 +1390,31 @@ def _setup_split_targets_build(bucket_path, target_weights, revision=None):
       revision, bucket_path=fuzz_target_bucket_path, fuzz_targets=targets_list)
 
 
-def _get_latest_revision(bucket_paths):
-  """Get the latest revision."""
+def _get_latest_revision_and_build_url(bucket_paths):
+  """Get the latest revision, along with its build url in the first bucket so
+  that callers setting up that build don't have to rescan the url list."""
   build_urls = []
   for bucket_path in bucket_paths:
     urls_list = get_build_urls_list(bucket_path)
     if not urls_list:
       logs.log_error('Error getting list of build urls from %s.' % bucket_path)
-      return None
+      return None, None
 
     build_urls.append(BuildUrls(bucket_path=bucket_path, urls_list=urls_list))
 
   if len(build_urls) == 0:
     logs.log_error(
         'Attempted to get latest revision, but no build urls were found.')
-    return None
+    return None, None
 
   main_build_urls = build_urls[0]
   other_build_urls = build_urls[1:]
 
-  revision_pattern = revisions.revision_pattern_from_build_bucket_path(
-      main_build_urls.bucket_path)
+  revision_pattern = re.compile(
+      revisions.revision_pattern_from_build_bucket_path(
+          main_build_urls.bucket_path))
   for build_url in main_build_urls.urls_list:
-    match = re.match(revision_pattern, build_url)
+    match = revision_pattern.match(build_url)
     if not match:
       continue
 
@@ -1176,14 +1422,19 @@ def _get_latest_revision(bucket_paths):
     if (not other_build_urls or all(
         revisions.find_build_url(url.bucket_path, url.urls_list, revision)
         for url in other_build_urls)):
-      return revision
+      return revision, build_url
 
-  return None
+  return None, None
+
+
+def _get_latest_revision(bucket_paths):
+  """Get the latest revision."""
+  return _get_latest_revision_and_build_url(bucket_paths)[0]
 
 
 def setup_trunk_build(bucket_paths, build_prefix=None, target_weights=None):
   """Sets up latest trunk build."""
-  latest_revision = _get_latest_revision(bucket_paths)
+  latest_revision, build_url = _get_latest_revision_and_build_url(bucket_paths)
   if latest_revision is None:
     logs.log_error('Unable to find a matching revision.')
     return None
@@ -1192,7 +1443,8 @@ def setup_trunk_build(bucket_paths, build_prefix=None, target_weights=None):
       latest_revision,
       bucket_path=bucket_paths[0],
       build_prefix=build_prefix,
-      target_weights=target_weights)
+      target_weights=target_weights,
+      build_url=build_url)
   if not build:
     logs.log_error('Failed to set up a build.')
     return None
@@ -1204,18 +1456,22 @@ def setup_regular_build(revision,
                         bucket_path=None,
                         build_prefix='',
                         target_weights=None,
-                        fuzz_targets=None) -> RegularBuild:
-  """Sets up build with a particular revision."""
+                        fuzz_targets=None,
+                        build_url=None) -> RegularBuild:
+  """Sets up build with a particular revision. |build_url| may be passed by
+  callers that have already resolved the build url for this revision."""
   if not bucket_path:
     # Bucket path can be customized, otherwise get it from the default env var.
     bucket_path = get_bucket_path('RELEASE_BUILD_BUCKET_PATH')
 
-  build_urls = get_build_urls_list(bucket_path)
   job_type = environment.get_value('JOB_NAME')
-  if not build_urls:
-    logs.log_error('Error getting build urls for job %s.' % job_type)
-    return None
-  build_url = revisions.find_build_url(bucket_path, build_urls, revision)
+  if not build_url:
+    build_urls = get_build_urls_list(bucket_path)
+    if not build_urls:
+      logs.log_error('Error getting build urls for job %s.' % job_type)
+      return None
+    build_url = revisions.find_build_url(bucket_path, build_urls, revision)
+
   if not build_url:
     logs.log_error(
         'Error getting build url for job %s (r%d).' % (job_type, revision))
@@ -1234,6 +1490,18 @@ def setup_regular_build(revision,
         environment.is_kernel_fuzzer_job()):
     build_class = CuttlefishKernelBuild
 
+  # Additional binaries to pull (for fuzzing engines such as Centipede). The
+  # extra build unpacks inside the main build's directory and both setups
+  # mutate the task environment, so they cannot run concurrently; overlap the
+  # extra bucket listing with the main build setup instead.
+  extra_bucket_path = get_bucket_path('EXTRA_BUILD_BUCKET_PATH')
+  extra_build_urls_future = None
+  if extra_bucket_path:
+    extra_urls_executor = ThreadPoolExecutor(max_workers=1)
+    extra_build_urls_future = extra_urls_executor.submit(
+        get_build_urls_list, extra_bucket_path)
+    extra_urls_executor.shutdown(wait=False)
+
   result = None
   build = build_class(
       base_build_dir,
@@ -1245,14 +1513,14 @@ def setup_regular_build(revision,
   if build.setup():
     result = build
   else:
+    if extra_build_urls_future:
+      extra_build_urls_future.cancel()
     return None
 
-  # Additional binaries to pull (for fuzzing engines such as Centipede).
-  extra_bucket_path = get_bucket_path('EXTRA_BUILD_BUCKET_PATH')
   if extra_bucket_path:
     # Import here as this path is not available in App Engine context.
     from clusterfuzz._internal.bot.fuzzers import utils as fuzzer_utils
-    extra_build_urls = get_build_urls_list(extra_bucket_path)
+    extra_build_urls = extra_build_urls_future.result()
     extra_build_url = revisions.find_build_url(extra_bucket_path,
                                                extra_build_urls, revision)
     if not extra_build_url:
@@ -1411,9 +1679,23 @@ def has_symbolized_builds():
           environment.get_value('SYM_DEBUG_BUILD_BUCKET_PATH'))
 
 
+@memoize.wrap(memoize.FifoInMemory(1))
+def _get_chrpath_path():
+  """Return the path to chrpath. Memoized since rpath helpers are called once
+  per binary and the lookup walks $PATH each time."""
+  return environment.get_default_tool_path('chrpath')
+
+
+@memoize.wrap(memoize.FifoInMemory(1))
+def _get_patchelf_path():
+  """Return the path to patchelf. Memoized since rpath helpers are called once
+  per binary and the lookup walks $PATH each time."""
+  return shutil.which('patchelf')
+
+
 def _set_rpaths_chrpath(binary_path, rpaths):
   """Set rpaths using chrpath."""
-  chrpath = environment.get_default_tool_path('chrpath')
+  chrpath = _get_chrpath_path()
   if not chrpath:
     raise BuildManagerError('Failed to find chrpath')
 
@@ -1423,7 +1705,7 @@ def _set_rpaths_chrpath(binary_path, rpaths):
 
 def _set_rpaths_patchelf(binary_path, rpaths):
   """Set rpaths using patchelf."""
-  patchelf = shutil.which('patchelf')
+  patchelf = _get_patchelf_path()
   if not patchelf:
     raise BuildManagerError('Failed to find patchelf')
 
@@ -1437,7 +1719,7 @@ def set_rpaths(binary_path, rpaths):
   # Patchelf handles rpath patching much better, and allows e.g. extending the
   # length of the rpath. However, it loads the entire binary into memory so
   # does not work for large binaries, so use chrpath for larger binaries.
-  binary_size = os.path.getsize(binary_path)
+  binary_size = os.stat(binary_path).st_size
   if binary_size >= PATCHELF_SIZE_LIMIT:
     _set_rpaths_chrpath(binary_path, rpaths)
   else:
@@ -1446,7 +1728,7 @@ def set_rpaths(binary_path, rpaths):
 
 def get_rpaths(binary_path):
   """Get rpath of a binary."""
-  chrpath = environment.get_default_tool_path('chrpath')
+  chrpath = _get_chrpath_path()
   if not chrpath:
     raise BuildManagerError('Failed to find chrpath')
 
@@ -1482,9 +1764,22 @@ def check_app_path(app_path='APP_PATH') -> bool:
   return bool(app_path_value)
 
 
+@memoize.wrap(memoize.FifoInMemory(32))
+def _apply_bucket_path_overrides(bucket_path, platform_id):
+  """Apply any bucket path overrides. Memoized on the raw path and platform,
+  since resolving an override fetches and parses a remote config and
+  get_bucket_path is called many times per task."""
+  return overrides.check_and_apply_overrides(
+      bucket_path,
+      overrides.PLATFORM_ID_TO_BUILD_PATH_KEY,
+      platform_id=platform_id)
+
+
 def get_bucket_path(name):
   """Return build bucket path, applying any set overrides."""
   bucket_path = environment.get_value(name)
-  bucket_path = overrides.check_and_apply_overrides(
-      bucket_path, overrides.PLATFORM_ID_TO_BUILD_PATH_KEY)
-  return bucket_path
+  if not bucket_path:
+    return bucket_path
+
+  return _apply_bucket_path_overrides(bucket_path,
+                                      environment.get_platform_id())
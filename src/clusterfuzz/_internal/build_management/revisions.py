@@ -546,9 +546,10 @@ def find_build_url(bucket_path, build_url_list, revision):
   if not build_url_list:
     return None
 
-  revision_pattern = revision_pattern_from_build_bucket_path(bucket_path)
+  revision_pattern = re.compile(
+      revision_pattern_from_build_bucket_path(bucket_path))
   for build_url in build_url_list:
-    match = re.match(revision_pattern, build_url)
+    match = revision_pattern.match(build_url)
     if not match:
       continue
 
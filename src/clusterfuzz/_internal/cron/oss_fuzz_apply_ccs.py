@@ -13,25 +13,40 @@
 # limitations under the License.
 """Handler used for adding new CC's to filed oss-fuzz bugs."""
 
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import threading
 
 from clusterfuzz._internal.base import external_users
 from clusterfuzz._internal.base import memoize
 from clusterfuzz._internal.datastore import data_handler
 from clusterfuzz._internal.datastore import data_types
+from clusterfuzz._internal.datastore import ndb_init
 from clusterfuzz._internal.datastore import ndb_utils
 from clusterfuzz._internal.issue_management import issue_filer
 from clusterfuzz._internal.issue_management import issue_tracker_policy
 from clusterfuzz._internal.issue_management import issue_tracker_utils
+from clusterfuzz._internal.system import environment
+
+# Number of testcases to process concurrently. The work is entirely bound on
+# issue tracker round-trips, so threads are enough to overlap them.
+DEFAULT_CONCURRENCY = 32
 
 
 def get_open_testcases_with_bugs():
-  """Return iterator to open testcases with bugs."""
+  """Return iterator to open testcases with bugs. Only the properties the CC
+  update needs are projected, since full testcase entities carry large crash
+  data that would otherwise be fetched and decoded for every row."""
   return data_types.Testcase.query(
       ndb_utils.is_true(data_types.Testcase.open),
       data_types.Testcase.status == 'Processed',
-      data_types.Testcase.bug_information != '').order(  # pylint: disable=g-explicit-bool-comparison
-          data_types.Testcase.bug_information, data_types.Testcase.key)
+      data_types.Testcase.bug_information != '',  # pylint: disable=g-explicit-bool-comparison
+      projection=[
+          data_types.Testcase.bug_information,
+          data_types.Testcase.job_type,
+          data_types.Testcase.platform_id,
+          data_types.Testcase.security_flag,
+      ]).order(data_types.Testcase.bug_information, data_types.Testcase.key)
 
 
 @memoize.wrap(memoize.FifoInMemory(256))
@@ -41,38 +56,62 @@ def cc_users_for_job(job_type, security_flag):
   return external_users.cc_users_for_job(job_type, security_flag)
 
 
-def main():
-  """Cron handler for adding new CC's to oss-fuzz bugs.."""
-  for testcase in get_open_testcases_with_bugs():
-    issue_tracker = issue_tracker_utils.get_issue_tracker_for_testcase(testcase)
-    if not issue_tracker:
-      logging.error('Failed to get issue tracker manager for %s',
-                    testcase.key.id())
-      continue
-
-    policy = issue_tracker_policy.get(issue_tracker.project)
-    reported_label = policy.label('reported')
-    if not reported_label:
-      logging.info('No reported label.')
-      return True
-
-    reported_pattern = issue_filer.get_label_pattern(reported_label)
-
-    try:
-      issue = issue_tracker.get_original_issue(testcase.bug_information)
-    except:
-      logging.error('Error occurred when fetching issue %s.',
-                    testcase.bug_information)
-      continue
+def _get_issue_tracker(testcase, tracker_cache):
+  """Return the issue tracker for a testcase, cached per job type since the
+  underlying lookup is identical for all testcases sharing a job."""
+  issue_tracker = tracker_cache.get(testcase.job_type)
+  if issue_tracker is None:
+    issue_tracker = issue_tracker_utils.get_issue_tracker_for_testcase(
+        testcase)
+    if issue_tracker:
+      tracker_cache[testcase.job_type] = issue_tracker
+
+  return issue_tracker
+
+
+def _process_testcase(testcase, bug_locks, issue_cache, tracker_cache):
+  """Add new CC's to the bug for a single testcase."""
+  issue_tracker = _get_issue_tracker(testcase, tracker_cache)
+  if not issue_tracker:
+    logging.error('Failed to get issue tracker manager for %s',
+                  testcase.key.id())
+    return
+
+  policy = issue_tracker_policy.get(issue_tracker.project)
+  reported_label = policy.label('reported')
+  if not reported_label:
+    logging.info('No reported label.')
+    return
+
+  reported_pattern = issue_filer.get_label_pattern(reported_label)
+
+  # Multiple testcases commonly point to the same bug. Serialize all work on a
+  # given bug so the issue is fetched once and updates don't conflict.
+  cache_key = (issue_tracker.project, testcase.bug_information)
+  with bug_locks.setdefault(cache_key, threading.Lock()):
+    issue = issue_cache.get(cache_key)
+    if issue is None:
+      try:
+        issue = issue_tracker.get_original_issue(testcase.bug_information)
+      except:
+        logging.error('Error occurred when fetching issue %s.',
+                      testcase.bug_information)
+        return
+
+      if issue:
+        issue_cache[cache_key] = issue
 
     if not issue or not issue.is_open:
-      continue
+      return
 
     ccs = cc_users_for_job(testcase.job_type, testcase.security_flag)
-    new_ccs = [cc for cc in ccs if cc not in issue.ccs]
+    # Snapshot the existing CCs once; issue.ccs membership checks may be
+    # linear scans depending on the tracker implementation.
+    existing_ccs = frozenset(issue.ccs)
+    new_ccs = [cc for cc in ccs if cc not in existing_ccs]
     if not new_ccs:
       # Nothing to do.
-      continue
+      return
 
     for cc in new_ccs:
       logging.info('CCing %s on %s', cc, issue.id)
@@ -83,9 +122,15 @@ def main():
     if (not issue.labels.has_with_pattern(reported_pattern) and
         not data_handler.get_value_from_job_definition(
             testcase.job_type, 'DISABLE_DISCLOSURE', False)):
+      # Substitution handlers can read properties that aren't in the
+      # projection, such as the security severity (unindexed, so it cannot be
+      # projected) and the crash stacktrace. Fetch the full testcase for this
+      # rare path.
+      full_testcase = testcase.key.get()
+
       # Add reported label and deadline comment if necessary.
       for result in issue_filer.apply_substitutions(policy, reported_label,
-                                                    testcase):
+                                                    full_testcase):
         issue.labels.add(result)
 
       if policy.label('restrict_view') in issue.labels:
@@ -94,5 +139,27 @@ def main():
 
     issue.save(new_comment=comment, notify=True)
 
+
+def main():
+  """Cron handler for adding new CC's to oss-fuzz bugs.."""
+  # The per-testcase work is a chain of synchronous issue tracker round-trips,
+  # so fan it out over a bounded thread pool instead of paying one round-trip
+  # latency per testcase.
+  max_workers = int(
+      environment.get_value('APPLY_CCS_CONCURRENCY', DEFAULT_CONCURRENCY))
+  bug_locks = {}
+  issue_cache = {}
+  tracker_cache = {}
+  process_testcase = ndb_init.thread_wrapper(_process_testcase)
+
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    futures = [
+        executor.submit(process_testcase, testcase, bug_locks, issue_cache,
+                        tracker_cache)
+        for testcase in get_open_testcases_with_bugs()
+    ]
+    for future in futures:
+      future.result()
+
   logging.info('OSS fuzz apply ccs succeeded.')
   return True
@@ -134,6 +134,10 @@ class StorageProvider:
     """Read the data of a remote file."""
     raise NotImplementedError
 
+  def open_stream(self, remote_path, chunk_size=None):
+    """Open a seekable read stream for a remote file."""
+    raise NotImplementedError
+
   def write_data(self, data_or_fileobj, remote_path, metadata=None):
     """Write the data of a remote file."""
     raise NotImplementedError
@@ -321,6 +325,27 @@ class GcsProvider(StorageProvider):
       logs.log_warn('Failed to read cloud storage file %s.' % remote_path)
       raise
 
+  def open_stream(self, remote_path, chunk_size=None):
+    """Open a seekable read stream for a remote file. Reads are served via
+    ranged requests of |chunk_size| bytes instead of downloading the whole
+    object."""
+    bucket_name, path = get_bucket_name_and_path(remote_path)
+
+    client = _storage_client()
+    try:
+      bucket = client.bucket(bucket_name)
+      blob = bucket.blob(path, chunk_size=self._chunk_size())
+      if chunk_size:
+        return blob.open('rb', chunk_size=chunk_size)
+
+      return blob.open('rb')
+    except google.cloud.exceptions.GoogleCloudError as e:
+      if e.code == 404:
+        return None
+
+      logs.log_warn('Failed to open cloud storage file %s.' % remote_path)
+      raise
+
   def write_data(self, data_or_fileobj, remote_path, metadata=None):
     """Write the data of a remote file."""
     client = _storage_client()
@@ -599,6 +624,15 @@ class FileSystemProvider(StorageProvider):
     with open(fs_path, 'rb') as f:
       return f.read()
 
+  def open_stream(self, remote_path, chunk_size=None):
+    """Open a seekable read stream for a remote file."""
+    del chunk_size  # Local reads don't need chunking.
+    fs_path = self.convert_path(remote_path)
+    if not os.path.exists(fs_path):
+      return None
+
+    return open(fs_path, 'rb')
+
   def write_data(self, data_or_fileobj, remote_path, metadata=None):
     """Write the data of a remote file."""
     fs_path = self.convert_path_for_write(remote_path)
@@ -1022,6 +1056,16 @@ def read_data(cloud_storage_file_path):
   return _provider().read_data(cloud_storage_file_path)
 
 
+@retry.wrap(
+    retries=DEFAULT_FAIL_RETRIES,
+    delay=DEFAULT_FAIL_WAIT,
+    function='google_cloud_utils.storage.open_stream',
+    exception_types=_TRANSIENT_ERRORS)
+def open_stream(cloud_storage_file_path, chunk_size=None):
+  """Return a seekable read stream for a cloud storage file."""
+  return _provider().open_stream(cloud_storage_file_path, chunk_size=chunk_size)
+
+
 @retry.wrap(
     retries=DEFAULT_FAIL_RETRIES,
     delay=DEFAULT_FAIL_WAIT,
@@ -51,6 +51,31 @@ def _low_disk_space_threshold():
   return _DEFAULT_LOW_DISK_SPACE_THRESHOLD
 
 
+def _copy_file_contents(source_file_handle, destination_file_handle):
+  """Copy contents between two open binary files, using zero-copy sendfile
+  where the platform supports it."""
+  if hasattr(os, 'sendfile'):
+    try:
+      source_fd = source_file_handle.fileno()
+      destination_fd = destination_file_handle.fileno()
+      offset = 0
+      while True:
+        sent = os.sendfile(destination_fd, source_fd, offset,
+                           FILE_COPY_BUFFER_SIZE)
+        if not sent:
+          return
+        offset += sent
+    except OSError:
+      # sendfile is not supported for these file objects (e.g. special files),
+      # so fall back to a buffered copy from the beginning.
+      source_file_handle.seek(0)
+      destination_file_handle.seek(0)
+      destination_file_handle.truncate()
+
+  shutil.copyfileobj(source_file_handle, destination_file_handle,
+                     FILE_COPY_BUFFER_SIZE)
+
+
 def copy_file(source_file_path, destination_file_path):
   """Faster version of shutil.copy with buffer size."""
   if not os.path.exists(source_file_path):
@@ -61,8 +86,7 @@ def copy_file(source_file_path, destination_file_path):
   try:
     with open(source_file_path, 'rb') as source_file_handle:
       with open(destination_file_path, 'wb') as destination_file_handle:
-        shutil.copyfileobj(source_file_handle, destination_file_handle,
-                           FILE_COPY_BUFFER_SIZE)
+        _copy_file_contents(source_file_handle, destination_file_handle)
   except:
     error_occurred = True
 
@@ -67,8 +67,10 @@ def _mock_unpack_build(
 
 def _get_timestamp(base_build_dir):
   """Return the timestamp, or None."""
-  return utils.read_data_from_file(
-      os.path.join(base_build_dir, '.timestamp'), eval_data=True)
+  try:
+    return os.stat(os.path.join(base_build_dir, '.timestamp')).st_mtime
+  except OSError:
+    return None
 
 
 class TrunkBuildTest(unittest.TestCase):
@@ -115,7 +117,8 @@ class TrunkBuildTest(unittest.TestCase):
         10,
         'gs://path/file-release-([0-9]+).zip',
         build_prefix=None,
-        target_weights=None)
+        target_weights=None,
+        build_url='gs://path/file-release-10.zip')
 
   def test_setup_mismatch(self):
     """Test setup finding the first matching revision."""
@@ -142,7 +145,8 @@ class TrunkBuildTest(unittest.TestCase):
         2,
         'gs://path/file-release-([0-9]+).zip',
         build_prefix=None,
-        target_weights=None)
+        target_weights=None,
+        build_url='gs://path/file-release-2.zip')
 
   def test_setup_fail(self):
     """Test setup failing to find any matching revisions."""
@@ -386,6 +390,7 @@ class RegularBuildTest(fake_filesystem_unittest.TestCase):
         'gs://path/file-release-2.zip',
     ]
 
+    self.mock.time.return_value = 1000.0
     build = build_manager.setup_regular_build(2)
     self.assertTrue(
         os.path.isdir(
@@ -414,6 +419,7 @@ class RegularLibFuzzerBuildTest(fake_filesystem_unittest.TestCase):
         'clusterfuzz._internal.system.shell.clear_temp_directory',
         'clusterfuzz._internal.google_cloud_utils.storage.copy_file_from',
         'clusterfuzz._internal.google_cloud_utils.storage.get_object_size',
+        'clusterfuzz._internal.google_cloud_utils.storage.open_stream',
         'time.time',
     ])
 
@@ -431,6 +437,8 @@ class RegularLibFuzzerBuildTest(fake_filesystem_unittest.TestCase):
     }
     self.mock.get_object_size.return_value = 1
     self.mock.copy_file_from.return_value = True
+    # Exercise the local download path by default.
+    self.mock.open_stream.return_value = None
 
     self.mock.get_fuzz_targets.return_value = [
         '/path/target1', '/path/target2', '/path/target3'
@@ -884,6 +892,7 @@ class SymbolizedBuildTest(fake_filesystem_unittest.TestCase):
         'gs://path/file-debug-1.zip',
     ])
 
+    self.mock.time.return_value = 1000.0
     build = build_manager.setup_symbolized_builds(2)
     self.assertTrue(
         os.path.isdir('/builds/path_be4c9ca0267afcd38b7c1a3eebb5998d0908f025/'
@@ -1162,6 +1171,16 @@ class BuildEvictionTests(fake_filesystem_unittest.TestCase):
         '/builds/build2/.timestamp', contents='1486166110.142942')
     self.fs.create_file(
         '/builds/build3/.timestamp', contents='1486166112.180345')
+    os.utime('/builds/build1/.timestamp', (1486166114.668105,) * 2)
+    os.utime('/builds/build2/.timestamp', (1486166110.142942,) * 2)
+    os.utime('/builds/build3/.timestamp', (1486166112.180345,) * 2)
+
+    # Deleting a build frees its size without a disk space re-probe, so give
+    # each build a known size.
+    build_size = 5 * 1024 * 1024 * 1024  # 5 GB
+    self.fs.create_file('/builds/build1/revisions/build', st_size=build_size)
+    self.fs.create_file('/builds/build2/revisions/build', st_size=build_size)
+    self.fs.create_file('/builds/build3/revisions/build', st_size=build_size)
 
     self.free_disk_space = []
     self.mock.is_chromium.return_value = True
@@ -1174,7 +1193,6 @@ class BuildEvictionTests(fake_filesystem_unittest.TestCase):
     self.mock.get_free_disk_space.side_effect = self._mock_free_disk_space
     self.free_disk_space = [
         9 * 1024 * 1024 * 1024,
-        24 * 1024 * 1024 * 1024,
     ]
 
     size = 1 * 1024 * 1024 * 1024  # 1 GB
@@ -1189,9 +1207,7 @@ class BuildEvictionTests(fake_filesystem_unittest.TestCase):
     """Test _make_space (remove 2 builds)."""
     self.mock.get_free_disk_space.side_effect = self._mock_free_disk_space
     self.free_disk_space = [
-        8 * 1024 * 1024 * 1024,
-        9 * 1024 * 1024 * 1024,
-        12 * 1024 * 1024 * 1024,
+        5 * 1024 * 1024 * 1024,
     ]
 
     size = 1 * 1024 * 1024 * 1024  # 1 GB
@@ -1206,10 +1222,8 @@ class BuildEvictionTests(fake_filesystem_unittest.TestCase):
     """Test _make_space (remove 3 builds)."""
     self.mock.get_free_disk_space.side_effect = self._mock_free_disk_space
     self.free_disk_space = [
-        7 * 1024 * 1024 * 1024,
-        8 * 1024 * 1024 * 1024,
-        9 * 1024 * 1024 * 1024,
-        14 * 1024 * 1024 * 1024,
+        512 * 1024 * 1024,
+        16 * 1024 * 1024 * 1024,
     ]
 
     size = 1 * 1024 * 1024 * 1024  # 1 GB
@@ -1225,9 +1239,7 @@ class BuildEvictionTests(fake_filesystem_unittest.TestCase):
     self.mock.get_free_disk_space.side_effect = self._mock_free_disk_space
     self.free_disk_space = [
         12 * 1024 * 1024 * 1024,
-        17 * 1024 * 1024 * 1024,
         18 * 1024 * 1024 * 1024,
-        24 * 1024 * 1024 * 1024,
     ]
 
     size = 20 * 1024 * 1024 * 1024  # 1 GB
@@ -1560,6 +1572,7 @@ class SplitFuzzTargetsBuildTest(fake_filesystem_unittest.TestCase):
         'clusterfuzz._internal.google_cloud_utils.storage.copy_file_from',
         'clusterfuzz._internal.google_cloud_utils.storage.get_object_size',
         'clusterfuzz._internal.google_cloud_utils.storage.list_blobs',
+        'clusterfuzz._internal.google_cloud_utils.storage.open_stream',
         'clusterfuzz._internal.google_cloud_utils.storage.read_data',
         'time.time',
     ])
@@ -1590,6 +1603,8 @@ class SplitFuzzTargetsBuildTest(fake_filesystem_unittest.TestCase):
     }
     self.mock.get_object_size.return_value = 1
     self.mock.copy_file_from.return_value = True
+    # Exercise the local download path by default.
+    self.mock.open_stream.return_value = None
 
     self.mock._make_space.return_value = True
     self.mock.open.return_value.__enter__.return_value.unpack.return_value = True